@@ -1,22 +1,49 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import functools
+import importlib.util
+import math
+import operator
 import os
-from langchain.agents import AgentExecutor, OpenAIFunctionsAgent
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, BaseMessage # Import BaseMessage
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.tools import Tool
-from langchain_openai import ChatOpenAI
-
-# --- 1. Configuration and LLM Initialization ---
-
-openai_api_key = os.environ.get("OPENAI_API_KEY")
-if not openai_api_key:
-    raise ValueError(
-        "OpenAI API key not found. Please set the OPENAI_API_KEY environment variable."
-    )
+import sys
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+# LangChain and its dependencies take a noticeable time to import, so they are
+# only loaded by `_init()` the first time the agent is actually used.
+if TYPE_CHECKING:
+    from langchain_core.messages import BaseMessage
 
-llm = ChatOpenAI(model_name="gpt-4-turbo-preview", temperature=0)
+# --- 1. Define the Tools ---
 
-# --- 2. Define the Tools ---
+# Checked in priority order; the first keyword found in the preferences wins.
+_GROCERY_TABLE = (
+    ("vegan", "Tofu, Almond milk, Broccoli, Quinoa, Spinach, Vegan cheese"),
+    ("vegetarian", "Eggs, Milk, Broccoli, Pasta, Spinach, Cheddar cheese"),
+    ("low carb", "Chicken breast, Salmon, Avocado, Broccoli, Olive oil, Eggs"),
+    ("high protein", "Chicken breast, Salmon, Protein powder, Greek yogurt, Lentils, Eggs"),
+)
+_DEFAULT_GROCERIES = "Bread, Milk, Eggs, Apples, Chicken, Rice"
+
+# With `pyahocorasick` installed, all keywords are matched in one pass over the
+# preferences, however large the table grows. Each keyword maps to its position
+# in the table so the highest-priority match still wins.
+try:
+    import ahocorasick
+except ImportError:
+    _GROCERY_AUTOMATON = None
+else:
+    _GROCERY_AUTOMATON = ahocorasick.Automaton()
+    for _priority, (_keyword, _) in enumerate(_GROCERY_TABLE):
+        _GROCERY_AUTOMATON.add_word(_keyword, _priority)
+    _GROCERY_AUTOMATON.make_automaton()
 
+# The lookup is pure, so repeated tool calls with the same input (e.g. when the
+# model retries a step) are answered from the cache.
+@functools.lru_cache(maxsize=256)
 def suggest_groceries(preferences: str) -> str:
     """Suggests a list of groceries based on user preferences.
 
@@ -26,91 +53,473 @@ def suggest_groceries(preferences: str) -> str:
     Returns:
         A string containing a comma-separated list of suggested grocery items.
     """
+    # str.lower() already has an ASCII fast path in CPython and beats both
+    # str.translate() and bytes.lower() for inputs of this size.
     preferences_lower = preferences.lower()
-    if "vegan" in preferences_lower:
-        return "Tofu, Almond milk, Broccoli, Quinoa, Spinach, Vegan cheese"
-    elif "vegetarian" in preferences_lower:
-        return "Eggs, Milk, Broccoli, Pasta, Spinach, Cheddar cheese"
-    elif "low carb" in preferences_lower:
-        return "Chicken breast, Salmon, Avocado, Broccoli, Olive oil, Eggs"
-    elif "high protein" in preferences_lower:
-        return "Chicken breast, Salmon, Protein powder, Greek yogurt, Lentils, Eggs"
-    else:
-        return "Bread, Milk, Eggs, Apples, Chicken, Rice"
-
-tools = [
-    Tool(
-        name="grocery_suggestion",
-        func=suggest_groceries,
-        description="""Useful for suggesting a list of groceries to buy.
-        Use this tool when the user asks for a grocery list, or asks what to buy.
-        The input to this tool should be a string describing the user's dietary preferences or needs.""",
+    if _GROCERY_AUTOMATON is not None:
+        priority = min((p for _, p in _GROCERY_AUTOMATON.iter(preferences_lower)), default=None)
+        return _DEFAULT_GROCERIES if priority is None else _GROCERY_TABLE[priority][1]
+    return next(
+        (items for keyword, items in _GROCERY_TABLE if keyword in preferences_lower),
+        _DEFAULT_GROCERIES,
     )
-]
-
-# --- 3. Define the Prompt Template ---
-
-prompt = ChatPromptTemplate.from_messages(
-    [
-        SystemMessage(
-            "You are a helpful shopping assistant. Your job is to understand the user's needs and suggest groceries using the tools available to you."
-        ),
-        MessagesPlaceholder(variable_name="chat_history", optional=True),
-        HumanMessage("{input}"),
-        # This placeholder is for the agent's internal thoughts and tool interactions.
-        # It MUST be a list of BaseMessage objects.
-        MessagesPlaceholder(variable_name="agent_scratchpad"),
-    ]
+
+GROCERY_TOOL_NAME = "grocery_suggestion"
+GROCERY_TOOL_DESCRIPTION = (
+    "Useful for suggesting a list of groceries to buy.\n"
+    "Use this tool when the user asks for a grocery list, or asks what to buy.\n"
+    "The input to this tool should be a string describing the user's dietary preferences or needs."
+)
+
+# --- 2. Define the Prompt Template ---
+
+# Kept as a single module-level constant so every request starts with a
+# byte-identical prefix, which lets OpenAI's automatic prompt caching reuse it.
+# All static text (instructions and tool catalogue) lives here, ahead of the
+# per-turn chat history, input and scratchpad.
+SYSTEM_PROMPT = (
+    "You are a helpful shopping assistant. Your job is to understand the user's "
+    "needs and suggest groceries using the tools available to you.\n\n"
+    "Available tools:\n"
+    f"- {GROCERY_TOOL_NAME}: {GROCERY_TOOL_DESCRIPTION}"
 )
 
-# --- 4. Create the Agent and Executor ---
+# --- 3. Initialize the LLMs, Agent and Executor ---
+
+# Printing every intermediate agent step is useful for debugging but costs
+# time on each turn. Enable it with AGENT_VERBOSE=1.
+VERBOSE = os.environ.get("AGENT_VERBOSE", "0") == "1"
+
+# Answers to history-free requests are cached; see section 4.
+RESPONSE_CACHE_SIZE = 512
+
+# The semantic cache also matches near-duplicate wording, at the cost of an
+# embedding request per lookup. Enable it with AGENT_SEMANTIC_CACHE=1.
+SEMANTIC_CACHE_ENABLED = os.environ.get("AGENT_SEMANTIC_CACHE", "0") == "1"
+SEMANTIC_CACHE_SIZE = 128
+SEMANTIC_CACHE_THRESHOLD = 0.95
+
+# Built by `_init()`; module-level attribute access also triggers it.
+_LAZY_NAMES = ("tools", "SYSTEM_MSG", "prompt")
+
+@functools.cache
+def _init() -> None:
+    """Imports LangChain and builds the tools and prompt.
+
+    Runs once, on first use, so that importing this module stays cheap. It also
+    checks the configuration, so a missing dependency or API key fails here.
+    """
+    global tools, SYSTEM_MSG, prompt
+
+    # Imported only to report a missing dependency at startup rather than when
+    # the first session opens.
+    import httpx  # noqa: F401
+    from langchain_core.messages import SystemMessage
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+    from langchain.tools import Tool
+
+    openai_api_key = os.environ.get("OPENAI_API_KEY")
+    if not openai_api_key:
+        raise ValueError(
+            "OpenAI API key not found. Please set the OPENAI_API_KEY environment variable."
+        )
+
+    tools = [
+        Tool(
+            name=GROCERY_TOOL_NAME,
+            func=suggest_groceries,
+            description=GROCERY_TOOL_DESCRIPTION,
+        )
+    ]
+
+    SYSTEM_MSG = SystemMessage(SYSTEM_PROMPT)
+
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            SYSTEM_MSG,
+            # Everything below changes from turn to turn, so it comes after the
+            # static system block to keep the shared prefix as long as possible.
+            MessagesPlaceholder(variable_name="chat_history", optional=True),
+            # A template, not a HumanMessage, so that "{input}" is filled in.
+            ("human", "{input}"),
+            # This placeholder is for the agent's internal thoughts and tool interactions.
+            # It MUST be a list of BaseMessage objects.
+            MessagesPlaceholder(variable_name="agent_scratchpad"),
+        ]
+    )
+
+def __getattr__(name):
+    if name in _LAZY_NAMES:
+        # Surface setup failures as AttributeError so hasattr()/getattr() with a
+        # default behave as usual; the original error is chained.
+        try:
+            _init()
+        except (ImportError, ValueError) as e:
+            raise AttributeError(
+                f"module {__name__!r} attribute {name!r} is unavailable: {e}"
+            ) from e
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@dataclass
+class AgentSession:
+    """The LLM clients and agent executor opened by `agent_session()`."""
+
+    llm: Any
+    summarizer_llm: Any
+    agent_executor: Any
+    embeddings: Any = None
+
+@contextlib.asynccontextmanager
+async def agent_session():
+    """Builds the LLM clients and agent executor for the running event loop.
+
+    All model calls share one pooled HTTP client, which keeps connections alive
+    across turns and concurrent batch requests. Its connections belong to the
+    event loop that opened them, so each `asyncio.run()` must open its own
+    session; leaving the `async with` block closes the client. Sessions are
+    independent of each other, so several can be open at once.
+
+    Yields:
+        The `AgentSession` to pass to `invoke_agent()` and `compact_history()`.
+    """
+    _init()
+    import httpx
+    from langchain.agents import AgentExecutor, create_openai_functions_agent
+    from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+    # HTTP/2 needs the optional `h2` package.
+    async with httpx.AsyncClient(
+        http2=importlib.util.find_spec("h2") is not None,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    ) as http_async_client:
+        llm = ChatOpenAI(
+            model_name="gpt-4-turbo-preview",
+            temperature=0,
+            http_async_client=http_async_client,
+        )
+
+        # A cheaper model used only to condense old conversation turns.
+        summarizer_llm = ChatOpenAI(
+            model_name="gpt-3.5-turbo",
+            temperature=0,
+            http_async_client=http_async_client,
+        )
+
+        # The system message is a ready-made message object, so the template
+        # passes it through untouched on every render. Binding the tools here
+        # converts them to OpenAI function schemas once, rather than on every
+        # agent step as OpenAIFunctionsAgent does.
+        agent = create_openai_functions_agent(llm, tools, prompt)
+
+        # `handle_parsing_errors=True` can sometimes help with unexpected LLM outputs.
+        agent_executor = AgentExecutor(
+            agent=agent, tools=tools, verbose=VERBOSE, handle_parsing_errors=True
+        )
+
+        embeddings = (
+            OpenAIEmbeddings(http_async_client=http_async_client)
+            if SEMANTIC_CACHE_ENABLED
+            else None
+        )
+        yield AgentSession(
+            llm=llm,
+            summarizer_llm=summarizer_llm,
+            agent_executor=agent_executor,
+            embeddings=embeddings,
+        )
+
+# --- 4. Response Cache ---
+
+# Answers to history-free requests are cached so repeated questions skip the
+# LLM round-trip. Requests with chat history are never cached, since the same
+# input can mean something different later in a conversation.
+_response_cache = OrderedDict()
+_semantic_cache = deque(maxlen=SEMANTIC_CACHE_SIZE)
+
+def _normalize_input(user_input: str) -> str:
+    """Returns the cache key for a history-free request."""
+    return user_input.strip().lower()
+
+def _unit_vector(v: list[float]) -> list[float]:
+    norm = math.sqrt(sum(map(operator.mul, v, v)))
+    return [x / norm for x in v] if norm else v
+
+def _dot(a: list[float], b: list[float]) -> float:
+    # Entries are stored as unit vectors, so this is their cosine similarity.
+    return sum(map(operator.mul, a, b))
+
+async def _semantic_lookup(session: AgentSession, key: str):
+    """Finds the closest cached response for a normalized input.
+
+    The cache is only an optimization, so a failed embedding request is
+    treated as a miss rather than failing the request.
+
+    Returns:
+        A `(response, embedding)` pair. `response` is None on a miss, and
+        `embedding` is None if the input could not be embedded.
+    """
+    try:
+        embedding = _unit_vector(await session.embeddings.aembed_query(key))
+    except Exception:
+        return None, None
+    best_score, best_response = max(
+        ((_dot(embedding, cached), response) for cached, response in _semantic_cache),
+        key=lambda scored: scored[0],
+        default=(0.0, None),
+    )
+    if best_score > SEMANTIC_CACHE_THRESHOLD:
+        return best_response, embedding
+    return None, embedding
+
+async def _call_agent(session: AgentSession, inputs: dict, on_token=None) -> str:
+    """Runs the agent executor once, optionally streaming the model's text.
+
+    Args:
+        session: The open session whose executor runs the request.
+        inputs: The executor inputs for this turn.
+        on_token: Called with each chunk of response text as it is generated.
+            If omitted, the full response is awaited in one call.
+
+    Returns:
+        The assistant's final response.
+    """
+    if on_token is None:
+        result = await session.agent_executor.ainvoke(inputs)
+        return result["output"]
+
+    output = ""
+    streamed = []
+    async for event in session.agent_executor.astream_events(inputs, version="v2"):
+        if event["event"] == "on_chat_model_stream":
+            token = event["data"]["chunk"].content
+            if token:
+                streamed.append(token)
+                on_token(token)
+        elif event["event"] == "on_chain_end" and not event["parent_ids"]:
+            output = event["data"]["output"]["output"]
+    # Some outputs never come from a model stream, such as the executor's
+    # iteration-limit message or a `handle_parsing_errors` reply.
+    if output and "".join(streamed) != output:
+        if streamed:
+            on_token("\n")
+        on_token(output)
+    return output
+
+async def invoke_agent(
+    session: AgentSession,
+    user_input: str,
+    chat_history: list[BaseMessage],
+    on_token=None,
+) -> str:
+    """Invokes the agent, serving history-free requests from the cache when possible.
+
+    Args:
+        session: The open session from `agent_session()`.
+        user_input: The user's message for this turn.
+        chat_history: The prior conversation messages.
+        on_token: Called with each chunk of response text as it arrives. A
+            cached response is passed through in a single call.
+
+    Returns:
+        The assistant's response.
+    """
+    if chat_history:
+        return await _call_agent(
+            session,
+            {"input": user_input, "chat_history": chat_history, "agent_scratchpad": []},
+            on_token,
+        )
+
+    key = _normalize_input(user_input)
+    cached_response = _response_cache.get(key)
+    if cached_response is not None:
+        _response_cache.move_to_end(key)
 
-agent = OpenAIFunctionsAgent(llm=llm, tools=tools, prompt=prompt)
+    embedding = None
+    if cached_response is None and SEMANTIC_CACHE_ENABLED:
+        cached_response, embedding = await _semantic_lookup(session, key)
+
+    if cached_response is not None:
+        if on_token is not None:
+            on_token(cached_response)
+        return cached_response
+
+    # When invoking, ensure agent_scratchpad is provided as an empty list
+    # if there are no prior tool steps. LangChain will populate it.
+    response = await _call_agent(
+        session,
+        {"input": user_input, "chat_history": [], "agent_scratchpad": []},
+        on_token,
+    )
 
-# `handle_parsing_errors=True` can sometimes help with unexpected LLM outputs.
-agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True, handle_parsing_errors=True)
+    # An empty response means the run produced no output; caching it would
+    # serve the empty answer on every later hit.
+    if response:
+        _response_cache[key] = response
+        if len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+        if embedding is not None:
+            _semantic_cache.append((embedding, response))
+    return response
 
 # --- 5. Run the Agent (Interactive Loop) ---
 
-def run_agent():
+# Only the most recent turns (one user message and one reply each) are sent
+# back to the model verbatim, which keeps the prompt size bounded in long
+# sessions. Once the limit is passed, the oldest half is folded into a running
+# summary kept as a single SystemMessage at the start of the history.
+MAX_HISTORY_TURNS = 10
+SUMMARIZE_TURNS = MAX_HISTORY_TURNS // 2
+
+async def compact_history(session: AgentSession, chat_history: list[BaseMessage]) -> None:
+    """Summarizes the oldest turns in place once the history exceeds its limit.
+
+    If the summarizer call fails, the oldest turns are dropped instead, so the
+    history stays bounded and the caller's turn is not reported as failed.
+
+    Args:
+        session: The open session whose summarizer condenses the old turns.
+        chat_history: The conversation messages, optionally starting with a
+            summary SystemMessage from an earlier compaction.
+    """
+    from langchain_core.messages import SystemMessage
+
+    has_summary = bool(chat_history) and isinstance(chat_history[0], SystemMessage)
+    turns = chat_history[1:] if has_summary else chat_history
+    if len(turns) <= 2 * MAX_HISTORY_TURNS:
+        return
+
+    oldest, recent = turns[:2 * SUMMARIZE_TURNS], turns[2 * SUMMARIZE_TURNS:]
+    transcript = "\n".join(f"{message.type}: {message.content}" for message in oldest)
+    if has_summary:
+        transcript = f"{chat_history[0].content}\n{transcript}"
+    try:
+        summary = await session.summarizer_llm.ainvoke(
+            "Summarize this conversation between a user and a grocery shopping "
+            "assistant in a few sentences, keeping any dietary preferences and "
+            f"items discussed:\n\n{transcript}"
+        )
+    except Exception:
+        # The turn itself already succeeded, so don't fail it over the summary;
+        # drop the oldest turns instead to keep the history bounded.
+        del chat_history[int(has_summary):-2 * MAX_HISTORY_TURNS]
+        return
+    chat_history[:] = [
+        SystemMessage(content=f"Summary of the earlier conversation: {summary.content}"),
+        *recent,
+    ]
+
+def read_user_inputs():
+    """Yields user messages until end of input.
+
+    Interactive sessions prompt with `input()`, using `readline` for line
+    editing and history where it is available. Piped input, such as a
+    replayed transcript, is read line by line straight from `sys.stdin`.
+    """
+    if sys.stdin.isatty():
+        try:
+            import readline  # noqa: F401 -- enables line editing for input()
+        except ImportError:
+            pass
+        while True:
+            try:
+                yield input("You: ")
+            except EOFError:
+                return
+    else:
+        for line in sys.stdin:
+            yield line.rstrip("\n")
+
+def _write_token(token: str) -> None:
+    sys.stdout.write(token)
+    sys.stdout.flush()
+
+async def run_agent():
     """Runs the grocery shopping agent in an interactive command-line loop."""
+    # Set up before the loop so that a missing dependency or API key stops the
+    # script instead of being reported as a per-turn error.
+    _init()
+
     print("Welcome to the Grocery Shopping Assistant!")
     print("I can help you create a grocery list based on your preferences.")
     print("Type 'exit' to end the conversation.")
     print("-" * 50)
 
+    from langchain_core.messages import AIMessage, HumanMessage
+
     chat_history = []
 
-    while True:
-        user_input = input("You: ")
-        if user_input.lower() == "exit":
-            print("Goodbye!")
-            break
+    async with agent_session() as session:
+        for user_input in read_user_inputs():
+            if user_input.lower() == "exit":
+                break
+
+            try:
+                print("Assistant: ", end="", flush=True)
+                assistant_response = await invoke_agent(
+                    session, user_input, chat_history, on_token=_write_token
+                )
+                print()
+
+                # Update chat history for the next turn
+                chat_history.append(HumanMessage(content=user_input))
+                chat_history.append(AIMessage(content=assistant_response))
+                await compact_history(session, chat_history)
+
+            except Exception as e:
+                # End the "Assistant: " line before reporting the error.
+                print()
+                # Check if the error is due to agent_scratchpad type
+                if "agent_scratchpad should be a list of base messages" in str(e):
+                    print("Internal agent error related to scratchpad format. Trying to re-initialize.")
+                    # This often indicates an issue in the agent's internal state.
+                    # For robustness, we might clear history or warn the user.
+                    # In this basic example, we just let the loop continue after printing the error.
+                else:
+                    print(f"An unexpected error occurred: {e}")
+                print("Please try again or type 'exit' to quit.")
+
+    print("Goodbye!")
+
+async def run_batch(inputs: list[str], max_concurrency: int = 8) -> list[str]:
+    """Runs independent, history-free requests through the agent concurrently.
+
+    Requests that normalize to the same text are sent to the agent only once.
+
+    Args:
+        inputs: The user requests to answer.
+        max_concurrency: The maximum number of agent calls in flight at once.
+
+    Returns:
+        The assistant's response for each input, in the same order.
+
+    Raises:
+        ValueError: If `max_concurrency` is less than 1.
+    """
+    if max_concurrency < 1:
+        raise ValueError(f"max_concurrency must be at least 1, got {max_concurrency}.")
+    semaphore = asyncio.Semaphore(max_concurrency)
+    unique_inputs = {}
+    for x in inputs:
+        unique_inputs.setdefault(_normalize_input(x), x)
+
+    async def answer(session: AgentSession, x: str) -> str:
+        async with semaphore:
+            return await invoke_agent(session, x, [])
 
+    async with agent_session() as session:
+        tasks = [asyncio.ensure_future(answer(session, x)) for x in unique_inputs.values()]
         try:
-            # When invoking, ensure agent_scratchpad is provided as an empty list
-            # if there are no prior tool steps. LangChain will populate it.
-            result = agent_executor.invoke(
-                {"input": user_input, "chat_history": chat_history, "agent_scratchpad": []}
-            )
-            assistant_response = result["output"]
-
-            print("Assistant:", assistant_response)
-
-            # Update chat history for the next turn
-            chat_history.append(HumanMessage(content=user_input))
-            chat_history.append(AIMessage(content=assistant_response))
-
-        except Exception as e:
-            # Check if the error is due to agent_scratchpad type
-            if "agent_scratchpad should be a list of base messages" in str(e):
-                print("Internal agent error related to scratchpad format. Trying to re-initialize.")
-                # This often indicates an issue in the agent's internal state.
-                # For robustness, we might clear history or warn the user.
-                # In this basic example, we just let the loop continue after printing the error.
-            else:
-                print(f"An unexpected error occurred: {e}")
-            print("Please try again or type 'exit' to quit.")
+            responses = await asyncio.gather(*tasks)
+        except BaseException:
+            # Stop the other requests before the session closes their client.
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+    by_key = dict(zip(unique_inputs, responses))
+    return [by_key[_normalize_input(x)] for x in inputs]
 
 if __name__ == "__main__":
-    run_agent()
\ No newline at end of file
+    asyncio.run(run_agent())
\ No newline at end of file